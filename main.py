@@ -10,7 +10,12 @@ if __name__ == '__main__':
         optional_indicator = '?'
         parser = ArgumentParser()
         parser.add_argument('search_term', type=str, default='', nargs=optional_indicator)
-        search_term_from_args = parser.parse_args().search_term
+        parser.add_argument('--no-cache', action='store_true', help='Skip cached search results entirely.')
+        parser.add_argument('--refresh', action='store_true', help='Search again and overwrite any cached results.')
+        parser.add_argument('--filter-on-server', action='store_true', help='Let Tableau filter views and workbooks, instead of downloading all of them.')
+        parser.add_argument('--force-download', action='store_true', help='Download images again, even if they were downloaded before.')
+        arguments = parser.parse_args()
+        search_term_from_args = arguments.search_term
 
         tableau = Tableau(
             # Make sure this ends with a forward slash: /
@@ -23,7 +28,17 @@ if __name__ == '__main__':
             token_key='',
             token_value='',
 
-            console=console
+            console=console,
+
+            # Repeated searches are cached for a few minutes under ~/.cache/search-tableau/
+            use_cache=not arguments.no_cache,
+            refresh_cache=arguments.refresh,
+
+            # Images already in the downloads directory are skipped, unless you'd like them fresh.
+            force_download=arguments.force_download,
+
+            # Tableau does its own matching here, so results may differ slightly from searching locally.
+            filter_on_server=arguments.filter_on_server
         )
         if not tableau.valid():
             console.give_error('You must provide all Tableau configuration fields to authenticate properly.')
@@ -32,7 +47,7 @@ if __name__ == '__main__':
             console.give_warning('Be warned: using the default site, because you did not provide a content url with the personal access token.')
 
         choices = choice_values = [choice.value for choice in Choice]
-        choice = console.give_choices('Which would you like to search for?', choices)
+        choice = Choice(console.give_choices('Which would you like to search for?', choices))
         search_term = search_term_from_args if search_term_from_args != '' else console.give_choice(f'Enter what to search by')
 
         with console.loader('Signing in to Tableau...'):
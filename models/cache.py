@@ -0,0 +1,58 @@
+from functools import wraps
+from hashlib import blake2b
+from json import dump, load
+from pathlib import Path
+from time import time
+
+# Search results are small and made of plain strings, so JSON files are plenty.
+cache_directory = Path.home() / '.cache' / 'search-tableau'
+
+
+def cached(ttl=300):
+    """
+    - Caches search results on disk, keyed by server address, site, choice, search term, and whether Tableau did the filtering.
+    - Cached results older than `ttl` seconds are ignored and searched for again.
+    - Respects the `use_cache` and `refresh_cache` settings of the searching instance.
+    :param ttl: How many seconds cached results stay valid for.
+    :return: A decorator for `search(self, choice, term)` style methods.
+    """
+    def decorator(search):
+        @wraps(search)
+        def wrapper(self, choice, term: str) -> []:
+            if not self.use_cache:
+                return search(self, choice, term)
+
+            key = blake2b(f'{self.server_address}|{self.site_content_url}|{choice}|{term}|{self.filter_on_server}'.encode()).hexdigest()
+            path_to_entry = cache_directory / f'{key}.json'
+
+            if not self.refresh_cache:
+                entry = __read__(path_to_entry)
+                fresh = entry is not None and time() - entry.get('created', 0) < ttl
+                if fresh:
+                    return entry.get('results') or []
+
+            results = search(self, choice, term)
+            __write__(path_to_entry, {'created': time(), 'results': results})
+            return results
+
+        return wrapper
+
+    return decorator
+
+
+def __read__(path_to_entry: Path):
+    try:
+        with open(path_to_entry) as stream:
+            return load(stream)
+    except (OSError, ValueError):
+        return None
+
+
+def __write__(path_to_entry: Path, entry: {}) -> None:
+    # A cache that can't be written to shouldn't stop anybody from searching.
+    try:
+        path_to_entry.parent.mkdir(exist_ok=True, parents=True)
+        with open(path_to_entry, 'w') as stream:
+            dump(entry, stream)
+    except (OSError, TypeError):
+        pass
@@ -1,3 +1,4 @@
+import re
 from contextlib import contextmanager
 from rich import box
 from rich.console import Console as RichConsole
@@ -71,17 +72,19 @@ class Console:
         """
         - Gives the user a list of choices.
         - Continues repeatedly until a valid choice is received.
+        - Skips asking altogether when there's only one choice.
         :param message: Message to show to the user along with the choices.
         :param choices: List of choices displayed to the user.
         :return: The user's choice.
         """
+        if len(choices) == 1:
+            return choices[0]
+
+        # Rendered once, and printed in one go, however many attempts it takes.
+        menu = '\n'.join(f'{index}: {choice}' for index, choice in enumerate(choices, start=1))
         while True:
             self.header_console.print(f'\n{message}')
-
-            for index, choice in enumerate(choices, start=1):
-                self.body_console.print(f'{index}: {choice}')
-
-            self.body_console.print('')
+            self.body_console.print(f'{menu}\n')
             selected = Prompt.ask('Choose', console=self.header_console)
             self.body_console.print('')
 
@@ -107,9 +110,13 @@ class Console:
         :param results: The results retrieved using the search term.
         :return: Absolutely nothing.
         """
+        # Compiled once for every table, rather than walking each value by hand.
+        search_term_pattern = re.compile(re.escape(search_term), re.IGNORECASE)
+        highlighted_search_term = f'[{highlight_style}]\\g<0>[/{highlight_style}]'
+
         for group in results:
             title = group.get('title')
-            fields = group.get('fields') or []
+            fields = frozenset(group.get('fields') or [])
             data = group.get('data') or []
 
             table = Table(title=title.title(), box=box.HEAVY, show_lines=True, title_style=header_style, title_justify='left')
@@ -117,33 +124,15 @@ class Console:
             for header in table_headers:
                 table.add_column(header)
 
-            lowercase_search_term = search_term.lower()
+            # Worked out once per table, instead of once per cell.
+            searched_columns = [header in fields for header in table_headers]
 
-            def highlight(value: str, header: str) -> str:
+            def highlight(value: str, searched_column: bool) -> str:
                 value = value or ''
-                header = header or ''
-                lowercase_value = value.lower()
-                searched_column = header in fields
-                should_highlight = searched_column and lowercase_search_term in lowercase_value
-
-                if should_highlight:
-                    highlight_start_index = 0
-                    highlighted_value = ''
-                    while highlight_start_index < len(value):
-                        highlight_start = lowercase_value.find(lowercase_search_term, highlight_start_index)
-                        finished_highlighting = highlight_start == -1
-                        if finished_highlighting:
-                            rest_of_value = value[highlight_start_index:]
-                            highlighted_value += rest_of_value
-                            break
-
-                        highlighted_value += value[highlight_start_index:highlight_start] + f'[{highlight_style}]{value[highlight_start:highlight_start + len(search_term)]}[/{highlight_style}]'
-                        highlight_start_index = highlight_start + len(search_term)
-                    return highlighted_value
-                return value
+                return search_term_pattern.sub(highlighted_search_term, value) if searched_column else value
 
             for result in data:
-                values = [highlight(value, header) for header, value in zip(table_headers, result.values())]
+                values = [highlight(value, searched_column) for searched_column, value in zip(searched_columns, result.values())]
                 table.add_row(*values)
 
             self.print_with_vertical_space(table)
@@ -186,6 +175,13 @@ class Console:
         :param attempted_type: The type to attempt to convert the value to.
         :return: Whether the value can be converted to a particular type.
         """
+        # Whole numbers are by far the most common ask, and can be checked without raising anything.
+        if attempted_type is int and isinstance(value, str):
+            digits = value.strip()
+            if digits[:1] in ('+', '-'):
+                digits = digits[1:]
+            return digits.isdecimal()
+
         try:
             attempted_type(value)
             return True
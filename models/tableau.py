@@ -1,11 +1,57 @@
-from os import path
-from pathlib import Path
-from shutil import rmtree
-from tableauserverclient import PersonalAccessTokenAuth, Server, Pager, RequestOptions, ViewItem
+import re
+from bisect import bisect_right
+from collections import defaultdict
+from copy import deepcopy
+from functools import partial
+from math import ceil
+from os import makedirs, path
+from queue import Full, Queue
+from threading import Event
+from requests import Session
+from requests.adapters import HTTPAdapter
+from tableauserverclient import PersonalAccessTokenAuth, Server, Pager, RequestOptions, Filter, PaginationItem, ViewItem
+from models.cache import cached
 from models.choice import Choice
 from models.console import Console
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# Choice values are looked up once here, rather than on every search.
+VIEWS, WORKBOOKS, FLOWS, PROJECTS, ALL = (choice.value for choice in Choice)
+
+# (choice, server endpoint to search on, curator method, fields to search on, fields to highlight search term on when displaying)
+# Bound to the signed in server and to the curators when signing in.
+resource_specs = [
+    (Choice.Views, 'views', '__curate_view__', ['content_url', 'name'], ['View Url', 'View Name', 'Navigable View Url']),
+    (Choice.Workbooks, 'workbooks', '__curate_workbook__', ['content_url', 'name'], ['Workbook Url', 'Workbook Name']),
+    (Choice.Flows, 'flows', '__curate_flow__', ['webpage_url', 'name', 'description'], ['Flow Webpage Url', 'Flow Name', 'Flow Description']),
+    (Choice.Projects, 'projects', '__curate_project__', ['name', 'description'], ['Project Name', 'Project Description']),
+]
+
+# How many pages of one resource, or how many images, are downloaded at once.
+page_workers = 8
+download_workers = 8
+
+# Every resource can be paged at the same time, so that's the most requests Tableau will have open at once.
+pooled_connections = max(len(resource_specs) * page_workers, download_workers)
+
+# Any part of a content url that mentions sheets, along with the slash before it. Navigable urls leave these out.
+sheets_segment = re.compile(r'/[^/]*sheets[^/]*')
+
+# The same, for when the very first part mentions sheets. That one takes the slash after it instead.
+leading_sheets_segment = re.compile(r'^[^/]*sheets[^/]*/?')
+
+# Searchable fields Tableau can filter on by itself, along with the field to filter by.
+server_filter_fields = {'name': RequestOptions.Field.Name, 'content_url': RequestOptions.Field.ContentUrl}
+
+# Tableau writes filters as `field:operator:value`, separated by commas, so terms with these can't be filtered on.
+filter_syntax_characters = (',', ':')
+
+# Joins an item's searchable fields, so a single substring check covers all of them without matching across two fields.
+field_separator = '\x1f'
+
+# Joins the search text of every item of a resource, so short terms can be found in one pass over all of them.
+item_separator = '\x1e'
+
 
 class Tableau:
     """
@@ -15,16 +61,26 @@ class Tableau:
     server = None
     resources = None
 
-    # Both views and workbooks here are to help downloading them later in program execution, if the user so wishes.
-    views_for_images = []
-    workbooks_for_images = []
+    # Both views and workbooks here, by id, are to help downloading them later in program execution, if the user so wishes.
+    views_for_images = {}
+    workbooks_for_images = {}
 
-    def __init__(self, server_address='', site_content_url='', token_key='', token_value='', console=Console()):
+    def __init__(self, server_address='', site_content_url='', token_key='', token_value='', console=Console(), use_cache=True, refresh_cache=False, force_download=False, filter_on_server=False):
         self.server_address = server_address
         self.site_content_url = site_content_url
         self.token_key = token_key
         self.token_value = token_value
         self.console = console
+        self.use_cache = use_cache
+        self.refresh_cache = refresh_cache
+        self.force_download = force_download
+        self.filter_on_server = filter_on_server
+
+        # Paged items, by title, so searching again in the same session skips paging.
+        self.paged_items = {}
+
+        # Trigram indexes of the paged items, by title. Only built once a resource is searched a second time.
+        self.trigram_indexes = {}
 
     def valid(self) -> bool:
         """
@@ -47,48 +103,65 @@ class Tableau:
         :return: Absolutely nothing.
         """
         authorization = PersonalAccessTokenAuth(self.token_key, self.token_value, site_id=self.site_content_url)
-        self.server = Server(server_address=self.server_address, use_server_version=True)
+        self.server = Server(server_address=self.server_address, use_server_version=True, session_factory=self.__pooled_session__)
         self.server.auth.sign_in(authorization)
+        self.paged_items = {}
+        self.trigram_indexes = {}
 
-        server = self.server
-        views = Choice.Views.value
-        workbooks = Choice.Workbooks.value
-        flows = Choice.Flows.value
-        projects = Choice.Projects.value
-
-        # (title, items to search on, curator function, fields to search on, fields to highlight search term on when displaying)
         self.resources = {
-            views: (views.title(), server.views, self.__curate_view__, ['content_url', 'name'], ['View Url', 'View Name', 'Navigable View Url']),
-            workbooks: (workbooks.title(), server.workbooks, self.__curate__workbook, ['content_url', 'name'], ['Workbook Url', 'Workbook Name']),
-            flows: (flows.title(), server.flows, self.__curate__flow, ['webpage_url', 'name', 'description'], ['Flow Webpage Url', 'Flow Name', 'Flow Description']),
-            projects: (projects.title(), server.projects, self.__curate__project, ['name', 'description'], ['Project Name', 'Project Description']),
+            choice: (choice.value.title(), getattr(self.server, endpoint), getattr(self, curator), searchable_fields, displayed_fields)
+            for choice, endpoint, curator, searchable_fields, displayed_fields in resource_specs
         }
 
+    @cached(ttl=300)
     def search(self, choice: Choice, term: str) -> []:
         """
-        Search Tableau using a given term.
+        - Search Tableau using a given term.
+        - Results are cached on disk for a few minutes, unless caching is turned off.
         :param choice: The type of Tableau resource to search against (either a particular type, or all).
         :param term: The term to search for.
         :return: The search results.
         """
         results = []
+        casefolded_term = term.casefold()
         default_filter = RequestOptions(pagesize=1000)
-        parameter_group = self.resources.values() if choice == Choice.All.value else [self.resources.get(choice)]
+        parameter_group = self.resources.values() if choice == Choice.All else [self.resources.get(choice)]
 
         def thread(parameters):
             title, resource, curator, searchable_fields, displayed_fields = parameters
 
-            should_store_view_for_download = title == Choice.Views.value
-            should_store_workbook_for_download = title == Choice.Workbooks.value
-
-            data = []
-            for item in (item for item in Pager(resource, default_filter) if self.__included__(term, searchable_fields, item)):
-                if should_store_view_for_download:
-                    self.views_for_images.append(item)
-                elif should_store_workbook_for_download:
-                    self.workbooks_for_images.append(item)
-
-                data.append(curator(item))
+            should_store_view_for_download = title == VIEWS
+            should_store_workbook_for_download = title == WORKBOOKS
+
+            filterable_on_server = (
+                self.filter_on_server
+                and all(column in server_filter_fields for column in searchable_fields)
+                and not any(character in term for character in filter_syntax_characters)
+            )
+            if filterable_on_server:
+                items = self.__filtered_on_server__(term, resource, default_filter, searchable_fields)
+                data_items = [item for item in items if self.__included__(casefolded_term, field_separator.join(self.__search_values__(item, searchable_fields)))]
+            else:
+                searched_before = title in self.paged_items
+                items, search_texts, all_search_text, starts = self.__paged_items__(title, resource, default_filter, searchable_fields)
+
+                # Building the trigram index costs far more than a single scan, so it only pays off once a resource is searched again.
+                narrowable = searched_before and len(casefolded_term) >= 3
+                if narrowable:
+                    candidates = self.__candidates__(casefolded_term, self.__trigram_index__(title, search_texts))
+                    positions = [position for position in candidates if self.__included__(casefolded_term, search_texts[position])]
+                else:
+                    positions = self.__scan__(casefolded_term, all_search_text, starts)
+
+                data_items = [items[position] for position in positions]
+            if should_store_view_for_download:
+                self.views_for_images.update({view.id: view for view in data_items})
+                # Views only know their workbook's id, so fetch every needed workbook in one go rather than one request per view.
+                curator = partial(curator, workbooks_by_id=self.__workbooks_by_id__({view.workbook_id for view in data_items}))
+            elif should_store_workbook_for_download:
+                self.workbooks_for_images.update({workbook.id: workbook for workbook in data_items})
+
+            data = [curator(item) for item in data_items]
 
             return {'title': title, 'fields': displayed_fields, 'data': data}
 
@@ -112,10 +185,10 @@ class Tableau:
         def get_items(title: str) -> []:
             return list(filter(lambda result: result.get('title') == title, results))
 
-        views = get_items(Choice.Views.value)
+        views = get_items(VIEWS)
         view_count = len(views)
 
-        workbooks = get_items(Choice.Workbooks.value)
+        workbooks = get_items(WORKBOOKS)
         workbook_count = len(workbooks)
 
         images_exist = view_count + workbook_count > 0
@@ -134,14 +207,19 @@ class Tableau:
                 if len(items) <= 0:
                     return
 
-                download_results = []
-                data = items[0].get('data')
-                for item in data:
+                def download_item(item):
                     item_id = item.get(f'{title} Id')
                     item_name = item.get(f'{title} Name')
                     path_to_image = f'{path_to_directory}{item_name}#{item_id =}.png'
-                    download_result = download_func(item_id, path_to_image)
-                    download_results.append(download_result)
+                    if not self.force_download and self.__downloaded__(path_to_image):
+                        return {'Id': item_id, 'Path': path_to_image}
+
+                    return download_func(item_id, path_to_image)
+
+                # Each image is its own request, so download several at once. Results keep the order of the search results.
+                data = items[0].get('data')
+                with ThreadPoolExecutor(max_workers=download_workers) as executor:
+                    download_results = list(executor.map(download_item, data))
 
                 if len(download_results) == 0:
                     raise Exception(f'Could not download any images for {title.lower()}s.')
@@ -165,7 +243,8 @@ class Tableau:
         """
         result = {'Id': view_id, 'Path': path_to_image}
         try:
-            view = next(view for view in self.views_for_images if view.id == view_id)
+            # Cached search results don't come with views, so fetch the view when it's not around.
+            view = self.views_for_images.get(view_id) or self.server.views.get_by_id(view_id)
             self.server.views.populate_image(view)
             with open(path_to_image, 'wb') as stream:
                 stream.write(view.image)
@@ -183,7 +262,7 @@ class Tableau:
         """
         result = {'Id': workbook_id, 'Path': path_to_image}
         try:
-            workbook = next(workbook for workbook in self.workbooks_for_images if workbook.id == workbook_id)
+            workbook = self.workbooks_for_images.get(workbook_id) or self.server.workbooks.get_by_id(workbook_id)
             self.server.workbooks.populate_preview_image(workbook)
             with open(path_to_image, 'wb') as stream:
                 stream.write(workbook.preview_image)
@@ -192,9 +271,218 @@ class Tableau:
 
         return result
 
-    def __curate_view__(self, view):
-        workbook_id = view.workbook_id
-        workbook = self.server.workbooks.get_by_id(workbook_id)
+    def __paged_items__(self, title: str, resource, request_options: RequestOptions, searchable_fields: [str]) -> ([], [str], str, [int]):
+        """
+        - Pages every item of a resource once per session, along with the casefolded text of its searchable fields.
+        - Later searches for the same resource reuse both.
+        - Paging happens on its own thread, so the next page downloads while the current one is being prepared.
+        :param title: The title of the resource, used as the key for the paged items.
+        :param resource: The items to page through.
+        :param request_options: The request options to page with.
+        :param searchable_fields: The fields to search on.
+        :return: The paged items, their casefolded searchable fields joined into one string each, all of those strings joined together, and where each one starts in there.
+        """
+        if title not in self.paged_items:
+            # Roomy enough for a whole page, so the pager never waits on the search text before asking for the next one.
+            paged_items = Queue(maxsize=request_options.pagesize)
+            finished = None
+            stopped = Event()
+
+            def put(paged_item) -> bool:
+                # Gives up once nothing is taking items anymore, rather than waiting on a full queue forever.
+                while not stopped.is_set():
+                    try:
+                        paged_items.put(paged_item, timeout=0.1)
+                        return True
+                    except Full:
+                        continue
+
+                return False
+
+            def page():
+                try:
+                    for paged_item in self.__page__(resource, request_options):
+                        if not put(paged_item):
+                            return
+                finally:
+                    put(finished)
+
+            items = []
+            search_texts = []
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                pager = executor.submit(page)
+                try:
+                    for item in iter(paged_items.get, finished):
+                        items.append(item)
+                        search_texts.append(field_separator.join(self.__search_values__(item, searchable_fields)))
+                finally:
+                    # Lets the pager go, even when this stopped early.
+                    stopped.set()
+
+                # Surfaces any error raised while paging.
+                pager.result()
+
+            all_search_text = item_separator.join(search_texts)
+            starts = []
+            start = 0
+            for search_text in search_texts:
+                starts.append(start)
+                start += len(search_text) + len(item_separator)
+
+            self.paged_items[title] = (items, search_texts, all_search_text, starts)
+
+        return self.paged_items[title]
+
+    def __trigram_index__(self, title: str, search_texts: [str]) -> {}:
+        """
+        - Indexes the search text of a resource's paged items by trigram, once per session.
+        :param title: The title of the resource, used as the key for the index.
+        :param search_texts: The search text of each paged item.
+        :return: A mapping of each trigram to the positions of the items containing it.
+        """
+        if title not in self.trigram_indexes:
+            index = defaultdict(set)
+            for position, search_text in enumerate(search_texts):
+                for start in range(len(search_text) - 2):
+                    index[search_text[start:start + 3]].add(position)
+
+            self.trigram_indexes[title] = index
+
+        return self.trigram_indexes[title]
+
+    @staticmethod
+    def __pooled_session__() -> Session:
+        """
+        - Creates the session every request to Tableau goes through.
+        - Keeps a connection open for every page or image that can be downloaded at once, so each request skips the handshake.
+        - Should more requests than that ever be in flight, they wait for a free connection rather than opening throwaway ones.
+        :return: The session.
+        """
+        session = Session()
+        adapter = HTTPAdapter(pool_connections=pooled_connections, pool_maxsize=pooled_connections, pool_block=True)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        return session
+
+    def __filtered_on_server__(self, term: str, resource, request_options: RequestOptions, searchable_fields: [str]) -> []:
+        """
+        - Lets Tableau find the items containing the term, so only those get downloaded.
+        - Tableau combines filters with AND, so each field gets its own request and the results are combined.
+        :param term: The term to search for.
+        :param resource: The items to search through.
+        :param request_options: The request options to page with.
+        :param searchable_fields: The fields to search on. Each must be in `server_filter_fields`.
+        :return: The items Tableau found, without duplicates. They still need checking with `__included__`.
+        """
+        items_by_id = {}
+        for column in searchable_fields:
+            options = deepcopy(request_options)
+            options.filter.add(Filter(server_filter_fields[column], RequestOptions.Operator.Has, term))
+            items_by_id.update({item.id: item for item in self.__page__(resource, options)})
+
+        return list(items_by_id.values())
+
+    @staticmethod
+    def __search_values__(item, searchable_fields: [str]) -> [str]:
+        return [(getattr(item, column) or '').casefold() for column in searchable_fields]
+
+    @staticmethod
+    def __page__(resource, request_options: RequestOptions):
+        """
+        - Goes through every item of a resource, just like `Pager`.
+        - The first page tells how many pages there are, so the rest are downloaded all at once rather than one after another.
+        - Like `Pager`, stops after the first page when Tableau doesn't say how many items there are.
+        :param resource: The items to page through.
+        :param request_options: The request options to page with.
+        :return: Every item, in page order.
+        """
+        def get_page(page_number: int, page_size: int) -> ([], PaginationItem):
+            options = deepcopy(request_options)
+            options.pagenumber = page_number
+            options.pagesize = page_size
+            return resource.get(options)
+
+        first_items, pagination = get_page(1, request_options.pagesize)
+        yield from first_items
+
+        total_available = pagination.total_available
+        page_size = pagination.page_size
+        paginated = total_available is not None and page_size is not None and total_available > 0 and page_size > 0
+        if not paginated:
+            return
+
+        # Later pages have to line up with the page size Tableau actually used for the first one.
+        page_count = ceil(total_available / page_size)
+        with ThreadPoolExecutor(max_workers=page_workers) as executor:
+            pages = [executor.submit(get_page, page_number, page_size) for page_number in range(2, page_count + 1)]
+            try:
+                for page in pages:
+                    items, _ = page.result()
+                    yield from items
+            finally:
+                # Nothing left to download once paging stops early.
+                for page in pages:
+                    page.cancel()
+
+    @staticmethod
+    def __candidates__(casefolded_term: str, index: {}) -> []:
+        """
+        - Narrows items down to those containing every trigram of the term.
+        - The term needs to be at least three characters long.
+        :param casefolded_term: The casefolded term being searched for.
+        :param index: The trigram index of the paged items.
+        :return: The positions of the candidate items, in their paged order. They still need checking with `__included__`.
+        """
+        trigrams = {casefolded_term[start:start + 3] for start in range(len(casefolded_term) - 2)}
+        postings = sorted((index.get(trigram, set()) for trigram in trigrams), key=len)
+        return sorted(set.intersection(*postings))
+
+    @staticmethod
+    def __scan__(casefolded_term: str, all_search_text: str, starts: [int]) -> [int]:
+        """
+        - Finds every item containing the term with one pass over the search text of all items.
+        - Only matching items cost any Python work, so this is used whenever there's no trigram index to narrow things down with.
+        :param casefolded_term: The casefolded term being searched for.
+        :param all_search_text: The search text of every item, joined together.
+        :param starts: Where each item's search text starts in `all_search_text`.
+        :return: The positions of the matching items, in their paged order.
+        """
+        positions = []
+        found_at = all_search_text.find(casefolded_term) if starts else -1
+        while found_at != -1:
+            position = bisect_right(starts, found_at) - 1
+            end = starts[position + 1] - len(item_separator) if position + 1 < len(starts) else len(all_search_text)
+
+            # A match running into the next item doesn't count, but there could still be one further along.
+            within_item = found_at + len(casefolded_term) <= end
+            if within_item:
+                positions.append(position)
+
+            search_from = end + len(item_separator) if within_item else found_at + 1
+            found_at = all_search_text.find(casefolded_term, search_from)
+
+        return positions
+
+    def __workbooks_by_id__(self, workbook_ids: {str}) -> {}:
+        """
+        - Fetches workbooks by id using as few requests as possible.
+        - Ids are sent in chunks to keep the filter within sensible url lengths.
+        :param workbook_ids: The ids of the workbooks to fetch.
+        :return: The fetched workbooks, keyed by id.
+        """
+        workbook_ids = list(workbook_ids)
+        chunk_size = 100
+        workbooks_by_id = {}
+        for start in range(0, len(workbook_ids), chunk_size):
+            options = RequestOptions(pagesize=1000)
+            options.filter.add(Filter(RequestOptions.Field.Id, RequestOptions.Operator.In, workbook_ids[start:start + chunk_size]))
+            workbooks_by_id.update({workbook.id: workbook for workbook in Pager(self.server.workbooks, options)})
+
+        return workbooks_by_id
+
+    def __curate_view__(self, view, workbooks_by_id={}):
+        workbook = workbooks_by_id.get(view.workbook_id) or self.server.workbooks.get_by_id(view.workbook_id)
         return {
             'View Id': view.id,
             'View Name': view.name,
@@ -205,7 +493,7 @@ class Tableau:
         }
 
     @staticmethod
-    def __curate__workbook(workbook):
+    def __curate_workbook__(workbook):
         return {
             'Workbook Id': workbook.id,
             'Workbook Name': workbook.name,
@@ -214,7 +502,7 @@ class Tableau:
         }
 
     @staticmethod
-    def __curate__flow(flow):
+    def __curate_flow__(flow):
         return {
             'Flow Id': flow.id,
             'Flow Name': flow.name,
@@ -224,7 +512,7 @@ class Tableau:
         }
 
     @staticmethod
-    def __curate__project(project):
+    def __curate_project__(project):
         return {
             'Project Id': project.id,
             'Parent Project ID': project.parent_id,
@@ -242,22 +530,19 @@ class Tableau:
         if not (slash in url and unwanted in url):
             return fallback
 
-        strings = url.split(slash)
-        filtered = list(filter(lambda string: unwanted not in string, strings))
-        navigable_url_suffix = slash.join(filtered)
+        navigable_url_suffix = leading_sheets_segment.sub('', sheets_segment.sub('', url), count=1)
 
         return f'{server_address}#/views/{navigable_url_suffix}'
 
     @staticmethod
-    def __included__(term: str, columns: [str], item):
-        for column in columns:
-            value = getattr(item, column) or ''
-            if term.lower() in value.lower():
-                return True
+    def __included__(casefolded_term: str, search_text: str) -> bool:
+        return casefolded_term in search_text
 
     @staticmethod
     def __create_directory__(path_to_directory: str):
-        if path.exists(path_to_directory):
-            rmtree(path_to_directory)
+        # Images from earlier runs are kept, so downloading the same results again is close to instant.
+        makedirs(path_to_directory, exist_ok=True)
 
-        Path(path_to_directory).mkdir(exist_ok=True, parents=True)
\ No newline at end of file
+    @staticmethod
+    def __downloaded__(path_to_image: str) -> bool:
+        return path.exists(path_to_image) and path.getsize(path_to_image) > 0
\ No newline at end of file